@@ -0,0 +1,52 @@
+"""Helpers shared by generate_responses_sk.py and translate_sk.py.
+
+Both scripts read and write JSONL through these functions, so they agree on
+how JSON is parsed and serialized whether or not orjson is installed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # optional; falls back to the stdlib json module
+    orjson = None
+
+# True when JSON is serialized with orjson rather than the stdlib json module.
+ORJSON_AVAILABLE = orjson is not None
+
+
+def loads(data: bytes | str) -> Any:
+    """Parse one JSON document (orjson when available)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize `obj` to UTF-8 JSON bytes without escaping non-ASCII characters."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+async def bounded(sem: asyncio.Semaphore, coro):
+    """Await `coro` while holding `sem`, capping the number of requests in flight."""
+    async with sem:
+        return await coro
+
+
+def truncate_partial_line(path: str) -> bytes:
+    """Cut off a trailing line left incomplete by an interrupted run.
+
+    New lines can then be appended safely. Returns the remaining file content.
+    """
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            data = data[:data.rfind(b"\n") + 1]
+            f.truncate(len(data))
+    return data
@@ -16,7 +16,9 @@
 """Binary of evaluating instruction following. See README.md."""
 
 import collections
+from concurrent import futures
 import dataclasses
+import functools
 import json
 import os
 from typing import Dict, Optional, Sequence, Union
@@ -43,6 +45,13 @@ _OUTPUT_DIR = flags.DEFINE_string(
     required=True,
 )
 
+_NUM_WORKERS = flags.DEFINE_integer(
+    "num_workers",
+    1,
+    "Number of processes used to evaluate the responses; 0 uses all CPUs.",
+    lower_bound=0,
+)
+
 
 @dataclasses.dataclass
 class InputExample:
@@ -199,6 +208,44 @@ def read_prompt_to_response_dict(input_jsonl_filename):
   return return_dict
 
 
+_worker_prompt_to_response = None
+
+
+def _init_worker(prompt_to_response):
+  """Hands the prompt to response mapping to a worker process once."""
+  global _worker_prompt_to_response
+  _worker_prompt_to_response = prompt_to_response
+
+
+def _evaluate_in_worker(func, inp):
+  return func(inp, _worker_prompt_to_response)
+
+
+def evaluate_all(func, inputs, prompt_to_response, num_workers=1):
+  """Applies an instruction following test to every input, in input order.
+
+  Args:
+    func: test_instruction_following_strict or
+      test_instruction_following_loose.
+    inputs: A list of InputExample.
+    prompt_to_response: A dictionary mapping prompts to responses.
+    num_workers: Number of processes to spread the inputs over; 0 uses all
+      CPUs and 1 evaluates in the current process.
+
+  Returns:
+    A list of OutputExample.
+  """
+  num_workers = num_workers or os.cpu_count()
+  if num_workers == 1:
+    return [func(inp, prompt_to_response) for inp in inputs]
+  with futures.ProcessPoolExecutor(
+      max_workers=num_workers,
+      initializer=_init_worker,
+      initargs=(prompt_to_response,)) as executor:
+    return list(executor.map(
+        functools.partial(_evaluate_in_worker, func), inputs, chunksize=16))
+
+
 def print_report(outputs):
   """Prints a report on accuracy scores."""
 
@@ -265,9 +312,8 @@ def main(argv):
       (test_instruction_following_loose, "eval_results_loose"),
   ]:
     logging.info("Generating %s...", output_file_name)
-    outputs = []
-    for inp in inputs:
-      outputs.append(func(inp, prompt_to_response))
+    outputs = evaluate_all(func, inputs, prompt_to_response,
+                           _NUM_WORKERS.value)
     follow_all_instructions = [o.follow_all_instructions for o in outputs]
     accuracy = sum(follow_all_instructions) / len(outputs)
     logging.info("Accuracy: %f", accuracy)
@@ -3,12 +3,19 @@
 
 Reads prompts from a JSONL file (e.g. data/sk_input_data.jsonl), sends each
 prompt to the model, and writes {"prompt": ..., "response": ...} lines to the
-output file.
+output file. Requests are dispatched concurrently (see --concurrency); the
+output preserves the input order. With --batch, all prompts are submitted as
+a single OpenAI Batch API job instead (cheaper, but completes asynchronously
+within 24h). An existing output file is resumed: prompts it already answers
+are skipped and new lines are appended (pass --overwrite to start over).
 
 Usage:
     export OPENAI_API_KEY=sk-...
     python3 generate_responses_sk.py -i data/sk_input_data.jsonl -o out_responses.jsonl
 
+    # Offline run through the OpenAI Batch API:
+    python3 generate_responses_sk.py -i data/sk_input_data.jsonl -o out_responses.jsonl --batch
+
     # Custom endpoint / local OpenAI-compatible server:
     python3 generate_responses_sk.py -i data/sk_input_data.jsonl -o out_responses.jsonl \\
         --base-url http://localhost:8000/v1 --api-key mykey --model mistral-7b
@@ -17,41 +24,282 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import asyncio
+import hashlib
 import json
+import mmap
 import os
+import stat
 import sys
-import time
+import tempfile
 from typing import Any
 
+from tqdm.auto import tqdm
+
+from api_utils import bounded, dumps, loads, truncate_partial_line
+
+# Output lines are flushed to disk every _FLUSH_EVERY prompts.
+_FLUSH_EVERY = 64
+
+
+def _cache_path(cache_dir: str, model: str, prompt: str) -> str:
+    key = hashlib.sha256(json.dumps({"m": model, "p": prompt}, sort_keys=True).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, key[:2], key)
+
+
+def read_cached_response(cache_dir: str, model: str, prompt: str) -> str | None:
+    """Return the cached response for (model, prompt), or None on a miss."""
+    try:
+        with open(_cache_path(cache_dir, model, prompt), "rb") as f:
+            return loads(f.read())["response"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def write_cached_response(cache_dir: str, model: str, prompt: str, response: str) -> None:
+    """Store a response atomically so concurrent or interrupted runs never see partial files."""
+    path = _cache_path(cache_dir, model, prompt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(dumps({"model": model, "prompt": prompt, "response": response}))
+    os.replace(tmp_path, path)
+
+
+async def get_response(client, prompt: str, model: str, retries: int = 3,
+                       cache_dir: str | None = None) -> str | None:
+    """Send a prompt to the model and return the response text.
 
-def get_response(client, prompt: str, model: str, retries: int = 3) -> str | None:
-    """Send a prompt to the model and return the response text."""
+    If `cache_dir` is given, a previously stored response for the same model
+    and prompt is returned without calling the API.
+    """
+    if cache_dir:
+        cached = read_cached_response(cache_dir, model, prompt)
+        if cached is not None:
+            return cached
     for attempt in range(retries):
         try:
-            response = client.chat.completions.create(
+            response = await client.chat.completions.create(
                 model=model,
                 messages=[{"role": "user", "content": prompt}],
             )
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            if cache_dir and content is not None:
+                write_cached_response(cache_dir, model, prompt, content)
+            return content
         except Exception as exc:
             if attempt == retries - 1:
                 print(f"[error] API error after {retries} attempts: {exc}", file=sys.stderr)
                 return None
             wait = 2 ** attempt
             print(f"[warn] API error (attempt {attempt + 1}/{retries}): {exc}. Retrying in {wait}s…", file=sys.stderr)
-            time.sleep(wait)
+            await asyncio.sleep(wait)
     return None
 
 
-def build_client(api_key: str, base_url: str | None):
-    from openai import OpenAI
-    kwargs: dict[str, Any] = {"api_key": api_key}
+async def read_batch_results(client, file_id: str, responses: list[str | None]) -> None:
+    """Fill `responses` from a Batch API output or error file, reporting failed requests."""
+    content = await client.files.content(file_id)
+    for line in content.text.splitlines():
+        if not line:
+            continue
+        result = loads(line)
+        body = (result.get("response") or {}).get("body") or {}
+        choices = body.get("choices")
+        if result.get("error") or not choices:
+            print(f"[error] Prompt {int(result['custom_id']) + 1}: {result.get('error') or body}", file=sys.stderr)
+            continue
+        responses[int(result["custom_id"])] = choices[0]["message"]["content"]
+
+
+async def get_batch_responses(client, prompts: list[str], model: str, cache_dir: str | None = None,
+                              poll_interval: float = 5.0, max_poll_interval: float = 300.0) -> list[str | None]:
+    """Run all prompts as one Batch API job and return responses in prompt order.
+
+    If `cache_dir` is given, cached prompts are not submitted and the batch
+    results are stored in the cache.
+    """
+    responses: list[str | None] = [None] * len(prompts)
+    if cache_dir:
+        for index, prompt in enumerate(prompts):
+            responses[index] = read_cached_response(cache_dir, model, prompt)
+    pending = [index for index, response in enumerate(responses) if response is None]
+    if not pending:
+        return responses
+
+    tmp = tempfile.NamedTemporaryFile("wb", suffix=".jsonl", delete=False)
+    try:
+        with tmp:
+            for index in pending:
+                request = {
+                    "custom_id": str(index),
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {"model": model, "messages": [{"role": "user", "content": prompts[index]}]},
+                }
+                tmp.write(dumps(request) + b"\n")
+        with open(tmp.name, "rb") as fbatch:
+            batch_file = await client.files.create(file=fbatch, purpose="batch")
+    finally:
+        os.remove(tmp.name)
+
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    print(f"[info] Submitted batch {batch.id} with {len(pending)} requests", file=sys.stderr)
+
+    wait = poll_interval
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        await asyncio.sleep(wait)
+        wait = min(wait * 2, max_poll_interval)
+        batch = await client.batches.retrieve(batch.id)
+        print(f"[info] Batch {batch.id} status: {batch.status}", file=sys.stderr)
+
+    if batch.status != "completed":
+        print(f"[error] Batch {batch.id} ended with status {batch.status}", file=sys.stderr)
+        sys.exit(1)
+
+    if batch.output_file_id:
+        await read_batch_results(client, batch.output_file_id, responses)
+    if batch.error_file_id:
+        await read_batch_results(client, batch.error_file_id, responses)
+    if cache_dir:
+        for index in pending:
+            if responses[index] is not None:
+                write_cached_response(cache_dir, model, prompts[index], responses[index])
+    return responses
+
+
+def build_client(api_key: str, base_url: str | None, concurrency: int = 20):
+    import httpx
+    from openai import AsyncOpenAI
+    try:
+        import h2  # noqa: F401  # optional, enables HTTP/2 multiplexing
+        http2 = True
+    except ImportError:
+        http2 = False
+    # One pooled client for the whole run keeps connections (and TLS sessions)
+    # alive between requests instead of re-handshaking for each prompt. No
+    # explicit transport is passed, so httpx still honours proxy environment
+    # variables; redirects and the 600 s read timeout match the SDK defaults.
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_keepalive_connections=max(64, concurrency),
+                            max_connections=max(128, 2 * concurrency)),
+        http2=http2,
+        timeout=httpx.Timeout(600.0, connect=5.0),
+        follow_redirects=True,
+    )
+    kwargs: dict[str, Any] = {"api_key": api_key, "http_client": http_client}
     if base_url:
         kwargs["base_url"] = base_url
-    return OpenAI(**kwargs)
+    return AsyncOpenAI(**kwargs)
+
+
+def _strip_line_ending(line: bytes) -> bytes:
+    """Remove a trailing `\n` or `\r\n` from a line."""
+    if line.endswith(b"\n"):
+        line = line[:-1]
+    if line.endswith(b"\r"):
+        line = line[:-1]
+    return line
+
+
+def iter_lines(path: str):
+    """Yield the lines of a file as bytes, without their trailing newline.
+
+    Both `\n` and `\r\n` line endings are removed, as in text mode.
+
+    Regular files are memory-mapped, so large inputs are paged in by the OS
+    rather than copied through Python's read buffer. Pipes and other streams
+    (e.g. /dev/stdin) are read line by line.
+    """
+    with open(path, "rb") as f:
+        st = os.fstat(f.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            for line in f:
+                yield _strip_line_ending(line)
+            return
+        if st.st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            size = len(mm)
+            while start < size:
+                end = mm.find(b"\n", start)
+                if end == -1:
+                    end = size
+                next_start = end + 1
+                if end > start and mm[end - 1] == 0x0D:  # b"\r"
+                    end -= 1
+                yield mm[start:end]
+                start = next_start
+
+
+def read_prompts(path: str) -> list[str]:
+    """Read the `prompt` field of every non-empty line of a JSONL file."""
+    prompts = []
+    for lineno, line in enumerate(iter_lines(path), start=1):
+        if not line:
+            continue
+        try:
+            obj = loads(line)
+        except json.JSONDecodeError as exc:
+            print(f"[error] Line {lineno}: invalid JSON – {exc}", file=sys.stderr)
+            sys.exit(1)
+        prompts.append(obj.get("prompt", ""))
+    return prompts
 
 
-def main() -> None:
+def read_answered_prompts(path: str) -> set[str]:
+    """Return the prompts that already have a response in an earlier output file.
+
+    A trailing line left incomplete by an interrupted run is cut off so new
+    lines can be appended. Prompts whose response is null are not included
+    and will be requested again.
+    """
+    truncate_partial_line(path)
+    answered = set()
+    for line in iter_lines(path):
+        if not line:
+            continue
+        try:
+            obj = loads(line)
+        except json.JSONDecodeError:
+            continue
+        if obj.get("response") is not None:
+            answered.add(obj.get("prompt", ""))
+    return answered
+
+
+async def iter_responses(client, prompts: list[str], args: argparse.Namespace):
+    """Yield (prompt, response) pairs in input order as soon as each one is ready.
+
+    A failed request yields its exception in place of the response.
+    """
+    if args.batch:
+        for prompt, response in zip(prompts, await get_batch_responses(client, prompts, args.model, args.cache_dir)):
+            yield prompt, response
+        return
+
+    sem = asyncio.Semaphore(max(1, args.concurrency))
+    tasks = [
+        asyncio.ensure_future(bounded(sem, get_response(client, prompt, args.model, args.retries, args.cache_dir)))
+        for prompt in prompts
+    ]
+    try:
+        for prompt, task in zip(prompts, tasks):
+            try:
+                yield prompt, await task
+            except Exception as exc:
+                yield prompt, exc
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def main() -> None:
     parser = argparse.ArgumentParser(description="Generate model responses for prompts in a JSONL file.")
     parser.add_argument("-i", "--input", default="data/sk_input_data.jsonl", help="Input JSONL file path (default: data/sk_input_data.jsonl)")
     parser.add_argument("-o", "--output", required=True, help="Output JSONL file path")
@@ -67,6 +315,10 @@ def main() -> None:
     )
     parser.add_argument("--model", default="gpt-4o-mini", help="Model name (default: gpt-4o-mini)")
     parser.add_argument("--retries", type=int, default=3, help="Retry count on transient errors (default: 3)")
+    parser.add_argument("--concurrency", type=int, default=20, help="Maximum number of requests in flight (default: 20)")
+    parser.add_argument("--cache-dir", default=None, help="Directory for an on-disk response cache keyed by (model, prompt)")
+    parser.add_argument("--batch", action="store_true", help="Submit all prompts as one OpenAI Batch API job and wait for it to finish")
+    parser.add_argument("--overwrite", action="store_true", help="Start the output file afresh instead of resuming it")
     args = parser.parse_args()
 
     api_key = args.api_key or os.environ.get("OPENAI_API_KEY")
@@ -74,27 +326,34 @@ def main() -> None:
         print("Error: provide --api-key or set the OPENAI_API_KEY environment variable.", file=sys.stderr)
         sys.exit(1)
 
-    client = build_client(api_key, args.base_url)
-
-    with open(args.input, encoding="utf-8") as fin, open(args.output, "w", encoding="utf-8") as fout:
-        for lineno, line in enumerate(fin, start=1):
-            line = line.rstrip("\n")
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-            except json.JSONDecodeError as exc:
-                print(f"[error] Line {lineno}: invalid JSON – {exc}", file=sys.stderr)
-                sys.exit(1)
+    prompts = read_prompts(args.input)
+    mode = "wb"
+    if not args.overwrite and os.path.exists(args.output):
+        answered = read_answered_prompts(args.output)
+        prompts = [prompt for prompt in prompts if prompt not in answered]
+        mode = "ab"
+        print(f"[info] Resuming {args.output}: {len(answered)} prompts already answered", file=sys.stderr)
 
-            prompt = obj.get("prompt", "")
-            response = get_response(client, prompt, args.model, args.retries)
-            out = {"prompt": prompt, "response": response}
-            fout.write(json.dumps(out, ensure_ascii=False) + "\n")
-            print(f"[info] Processed line {lineno}", file=sys.stderr)
+    client = build_client(api_key, args.base_url, args.concurrency)
+    try:
+        with open(args.output, mode, buffering=1 << 20) as fout, \
+                tqdm(total=len(prompts), unit="prompt", file=sys.stderr) as progress:
+            index = 0
+            async for prompt, response in iter_responses(client, prompts, args):
+                index += 1
+                if isinstance(response, BaseException):
+                    print(f"[error] Prompt {index}: {response}", file=sys.stderr)
+                    response = None
+                out = {"prompt": prompt, "response": response}
+                fout.write(dumps(out) + b"\n")
+                progress.update()
+                if index % _FLUSH_EVERY == 0:
+                    fout.flush()
+    finally:
+        await client.close()
 
     print(f"Done. Output written to {args.output}", file=sys.stderr)
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -21,9 +21,10 @@
 #   python -m spacy download xx_sent_ud_sm
 
 import spacy
+from spacy.attrs import IS_PUNCT, IS_UPPER
 
+import functools
 import random
-import re
 from typing import List
 
 import immutabledict
@@ -31,6 +32,8 @@ import immutabledict
 
 WORD_LIST = ["priateľ", "jedlo", "škola", "dom", "rodina", "práca", "čas", "kniha", "mesto", "pes"]  # pylint: disable=line-too-long
 
+_RNG = random.Random()
+
 # ISO 639-1 codes to language names in Slovak.
 LANGUAGE_CODES = immutabledict.immutabledict({
     "en": "Angličtina",
@@ -66,16 +69,61 @@ LANGUAGE_CODES = immutabledict.immutabledict({
     "sk": "Slovenčina",
     })
 
-_ALPHABETS = "([A-Za-z])"
-_PREFIXES = "(Dr|Mgr|Ing|PhDr|RNDr|MUDr|JUDr|PaedDr|Doc|Prof|Bc|Mr|St|Mrs|Ms|atď|resp|napr|tzv|vid|pozn)[.]"
-_SUFFIXES = "(Inc|Ltd|Jr|Sr|Co)"
-_STARTERS = r"(Dr|Mgr|Ing|Prof|Doc|Mr|Mrs|Ms|On\s|Ona\s|To\s|Oni\s|Ony\s|Jeho\s|Náš\s|Naša\s|My\s|Ale\s|Avšak\s|Ten\s|Tá\s|Tento\s|Táto\s|Kdekoľvek\s|Pokiaľ ide o\s|Preto\s|Napríklad\s|Stručne povedané\s|V dôsledku toho\s|Na druhej strane\s|Vzhľadom na\s)"
-_ACRONYMS = "([A-Z][.][A-Z][.](?:[A-Z][.])?)"
-_WEBSITES = "[.](com|net|org|io|gov|edu|me|sk|cz)"
-_DIGITS = "([0-9])"
-_MULTIPLE_DOTS = r"\.{2,}"
+# Abbreviations after which the multilingual model must not end a sentence,
+# e.g. "Ing. Novák" or "napr. jablko". The tokenizer splits them off as
+# "Ing" + ".", so they are matched without the trailing period.
+_ABBREVIATIONS = frozenset((
+    "Dr", "Mgr", "Ing", "PhDr", "RNDr", "MUDr", "JUDr", "PaedDr", "Doc",
+    "Prof", "Bc", "Mr", "St", "Mrs", "Ms", "atď", "resp", "napr", "tzv", "vid",
+    "pozn", "Ph", "Inc", "Ltd", "Jr", "Sr", "Co"))
+
+_TERMINALS = frozenset(".!?")
 
+# xx_sent_ud_sm ships only a tokenizer and a trained "senter", which is all
+# the helpers below use. Fall back to the rule-based sentencizer should a
+# model build come without sentence boundaries.
 nlp = spacy.load("xx_sent_ud_sm")
+if "senter" not in nlp.pipe_names and "sentencizer" not in nlp.pipe_names:
+  nlp.add_pipe("sentencizer")
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse(text):
+  """Returns the parsed `Doc` of a text.
+
+  A response is checked by several instructions, so the same text is parsed
+  once and shared by count_words, tokenize_words and count_sentences. The
+  returned `Doc` must not be modified.
+  """
+  return nlp(text)
+
+
+def _ends_with_abbreviation(sent):
+  """Returns True if a spaCy sentence span ends in an abbreviation or initial."""
+  last = sent[-1].text
+  if len(last) == 2 and last[0].isalpha() and last[1] == ".":
+    return True
+  return last == "." and len(sent) > 1 and (
+      sent[-2].text in _ABBREVIATIONS or
+      (len(sent[-2].text) == 1 and sent[-2].text.isalpha()))
+
+
+def _doc_sentences(doc):
+  """Returns the stripped sentences of a parsed `Doc`.
+
+  Sentences that the model closed right after an abbreviation are merged
+  with the following one.
+  """
+  sentences = []
+  start = 0
+  for sent in doc.sents:
+    if sent.end < len(doc) and _ends_with_abbreviation(sent):
+      continue
+    sentence = doc[start:sent.end].text.strip()
+    if sentence:
+      sentences.append(sentence)
+    start = sent.end
+  return sentences
 
 
 def split_into_sentences(text):
@@ -87,71 +135,115 @@ def split_into_sentences(text):
   Returns:
     A list of strings where each string is a sentence.
   """
-  text = " " + text + "  "
-  text = text.replace("\n", " ")
-  text = re.sub(_PREFIXES, "\\1<prd>", text)
-  text = re.sub(_WEBSITES, "<prd>\\1", text)
-  text = re.sub(_DIGITS + "[.]" + _DIGITS, "\\1<prd>\\2", text)
-  text = re.sub(
-      _MULTIPLE_DOTS,
-      lambda match: "<prd>" * len(match.group(0)) + "<stop>",
-      text,
-  )
-  if "Ph.D" in text:
-    text = text.replace("Ph.D.", "Ph<prd>D<prd>")
-  text = re.sub(r"\s" + _ALPHABETS + "[.] ", " \\1<prd> ", text)
-  text = re.sub(_ACRONYMS + " " + _STARTERS, "\\1<stop> \\2", text)
-  text = re.sub(
-      _ALPHABETS + "[.]" + _ALPHABETS + "[.]" + _ALPHABETS + "[.]",
-      "\\1<prd>\\2<prd>\\3<prd>",
-      text,
-  )
-  text = re.sub(
-      _ALPHABETS + "[.]" + _ALPHABETS + "[.]", "\\1<prd>\\2<prd>", text
-  )
-  text = re.sub(" " + _SUFFIXES + "[.] " + _STARTERS, " \\1<stop> \\2", text)
-  text = re.sub(" " + _SUFFIXES + "[.]", " \\1<prd>", text)
-  text = re.sub(" " + _ALPHABETS + "[.]", " \\1<prd>", text)
-  if "\u201c" in text:
-    text = text.replace(".\u201d", "\u201d.")
-  if '"' in text:
-    text = text.replace('."', '".')
-  if "!" in text:
-    text = text.replace('!"', '"!')
-  if "?" in text:
-    text = text.replace('?"', '"?')
-  text = text.replace(".", ".<stop>")
-  text = text.replace("?", "?<stop>")
-  text = text.replace("!", "!<stop>")
-  text = text.replace("<prd>", ".")
-  sentences = text.split("<stop>")
-  sentences = [s.strip() for s in sentences]
-  if sentences and not sentences[-1]:
-    sentences = sentences[:-1]
-  return sentences
+  words = text.split()
+  # Blank text and a single word with at most trailing terminal punctuation,
+  # e.g. "Ahoj.", cannot hold a sentence boundary; skip the model for them.
+  if not words:
+    return []
+  if len(words) == 1 and not _TERMINALS.intersection(words[0].rstrip(".!?")):
+    return words
+  return _doc_sentences(_parse(text.replace("\n", " ")))
+
+
+def split_into_sentences_many(texts, batch_size=64):
+  """Splits many texts into sentences in one batched pass of the spaCy model.
+
+  Args:
+    texts: An iterable of strings.
+    batch_size: Number of texts the model processes together.
+
+  Returns:
+    A list with the sentence list of each input text, in input order.
+  """
+  texts = (text.replace("\n", " ") for text in texts)
+  return [_doc_sentences(doc) for doc in nlp.pipe(texts, batch_size=batch_size)]
+
+
+def _count_non_punct(doc):
+  """Returns the number of non-punctuation tokens of a `Doc`."""
+  return len(doc) - int(doc.to_array(IS_PUNCT).sum())
 
 
 def count_words(text):
   """Counts the number of words using the multilingual spaCy model."""
-  tokenized_text = nlp(text)
-  num_words = len([token.text for token in tokenized_text if not token.is_punct])
-  return num_words
+  return _count_non_punct(_parse(text))
+
+
+def count_words_many(texts, batch_size=256):
+  """Counts the words of many texts in one batched pass of the spaCy model.
+
+  Args:
+    texts: An iterable of strings.
+    batch_size: Number of texts the model processes together.
+
+  Returns:
+    A list with the number of words of each input text, in input order.
+  """
+  return [_count_non_punct(doc)
+          for doc in nlp.pipe(texts, batch_size=batch_size)]
+
+
+def count_capital_words(text):
+  """Counts the words written entirely in capital letters."""
+  flags = _parse(text).to_array([IS_PUNCT, IS_UPPER])
+  if not len(flags):
+    return 0
+  return int((flags[:, 1] & (flags[:, 0] ^ 1)).sum())
+
+
+def iter_words(text):
+  """Yields the non-punctuation words using the multilingual spaCy model."""
+  return (token.text for token in _parse(text) if not token.is_punct)
 
 
 def tokenize_words(text):
   """Returns a list of non-punctuation words using the multilingual spaCy model."""
-  tokenized_text = nlp(text)
-  words = [token.text for token in tokenized_text if not token.is_punct]
-  return words
+  return list(iter_words(text))
+
+
+def tokenize_words_many(texts, batch_size=256):
+  """Tokenizes many texts in one batched pass of the spaCy model.
+
+  Args:
+    texts: An iterable of strings.
+    batch_size: Number of texts the model processes together.
+
+  Returns:
+    A list with the non-punctuation words of each input text, in input order.
+  """
+  return [[token.text for token in doc if not token.is_punct]
+          for doc in nlp.pipe(texts, batch_size=batch_size)]
 
 
 def count_sentences(text):
   """Count the number of sentences using the multilingual spaCy model."""
-  tokenized_text = nlp(text)
-  num_sentences = len(list(tokenized_text.sents))
-  return num_sentences
+  return sum(1 for _ in _parse(text).sents)
+
 
+def count_sentences_many(texts, batch_size=256):
+  """Counts the sentences of many texts in one batched pass of the spaCy model.
+
+  Args:
+    texts: An iterable of strings.
+    batch_size: Number of texts the model processes together.
+
+  Returns:
+    A list with the number of sentences of each input text, in input order.
+  """
+  return [sum(1 for _ in doc.sents)
+          for doc in nlp.pipe(texts, batch_size=batch_size)]
 
-def generate_keywords(num_keywords):
-  """Randomly generates a few keywords."""
-  return random.sample(WORD_LIST, k=num_keywords)
+
+def generate_keywords(num_keywords, rng=None):
+  """Randomly generates a few keywords.
+
+  Args:
+    num_keywords: Number of distinct keywords to draw from WORD_LIST.
+    rng: An optional `random.Random`. Threads or worker processes that need
+      reproducible keywords should pass their own seeded instance; by default
+      a module-level generator is used.
+
+  Returns:
+    A list of keywords.
+  """
+  return (rng or _RNG).sample(WORD_LIST, k=num_keywords)
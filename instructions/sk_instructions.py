@@ -14,28 +14,43 @@
 # limitations under the License.
 
 """Library of Slovak instructions."""
-import collections
+import functools
 import json
+import operator
 import random
 import re
 import string
+import sys
 from typing import Dict, Optional, Sequence, Union
 
 from absl import logging
-import langdetect
+import numpy as np
 import unicodedata
 
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
 from instruction_utils import sk_instructions_util
 
 
 _InstructionArgsDtype = Optional[Dict[str, Union[int, str, Sequence[str]]]]
 
 _LANGUAGES = sk_instructions_util.LANGUAGE_CODES
+_LANGUAGE_KEYS = tuple(_LANGUAGES)
 
 # The relational operation for comparison.
 # "aspoň" = at least, "menej ako" = less than / at most.
 # "minimálne" is accepted as a synonym for "aspoň" (see _normalize_relation).
-_COMPARISON_RELATION = ("aspoň", "menej ako")
+# The strings are interned so that equal relations compare by identity.
+_COMPARISON_RELATION = tuple(sys.intern(s) for s in ("aspoň", "menej ako"))
+
+# The comparison each relation stands for, as (count, threshold) -> bool.
+_RELATION_OPERATORS = {
+    _COMPARISON_RELATION[0]: operator.ge,
+    _COMPARISON_RELATION[1]: operator.le,
+}
 
 # Maximum number of sentences.
 _MAX_NUM_SENTENCES = 20
@@ -47,7 +62,8 @@ _NUM_PLACEHOLDERS = 4
 _NUM_BULLETS = 5
 
 # Options of constrained response.
-_CONSTRAINED_RESPONSE_OPTIONS = ("Áno.", "Nie.", "Možno.")
+_CONSTRAINED_RESPONSE_OPTIONS = tuple(
+    sys.intern(s) for s in ("Áno.", "Nie.", "Možno."))
 
 # Options of starter keywords.
 _STARTER_OPTIONS = ("Povedal by som", "Moja odpoveď je", "Myslím si",
@@ -63,7 +79,7 @@ _ENDING_OPTIONS = ("S pozdravom", "Potrebujete niečo ďalšie?",
 _NUM_HIGHLIGHTED_SECTIONS = 4
 
 # Section splitter keywords.
-_SECTION_SPLITER = ("Sekcia", "SEKCIA")
+_SECTION_SPLITER = tuple(sys.intern(s) for s in ("Sekcia", "SEKCIA"))
 
 # Number of sections.
 _NUM_SECTIONS = 5
@@ -72,7 +88,7 @@ _NUM_SECTIONS = 5
 _NUM_PARAGRAPHS = 5
 
 # Postscript markers used in Slovak.
-_POSTSCRIPT_MARKER = ("P.S.", "P.P.S")
+_POSTSCRIPT_MARKER = tuple(sys.intern(s) for s in ("P.S.", "P.P.S"))
 
 # Number of keywords.
 _NUM_KEYWORDS = 2
@@ -83,6 +99,10 @@ _KEYWORD_FREQUENCY = 3
 # Occurrences of a single letter.
 _LETTER_FREQUENCY = 20
 
+# The only non-ASCII characters whose lowercase form contains an ASCII letter:
+# "İ" (-> "i̇") and the Kelvin sign (-> "k").
+_NON_ASCII_UPPERCASE = {"i": ("\u0130",), "k": ("\u212a",)}
+
 # Occurrences of words with all capital letters.
 _ALL_CAPITAL_WORD_FREQUENCY = 20
 
@@ -90,14 +110,158 @@ _ALL_CAPITAL_WORD_FREQUENCY = 20
 _NUM_WORDS_LOWER_LIMIT = 1
 _NUM_WORDS_UPPER_LIMIT = 500
 
+# Placeholders such as [adresa].
+_PLACEHOLDER_RE = re.compile(r"\[.*?\]")
+
+# Markdown bullet list items.
+_BULLET_RE = re.compile(r"^\s*\*[^\*].*$", re.MULTILINE)
+
+# Highlighted sections, *text* and **text**.
+_HIGHLIGHT_RE = re.compile(r"\*[^\n\*]*\*")
+_DOUBLE_HIGHLIGHT_RE = re.compile(r"\*\*[^\n\*]*\*\*")
+
+# Titles wrapped in double angular brackets, e.g. <<báseň o radosti>>.
+_TITLE_RE = re.compile(r"<<[^\n]+>>")
+
+# Two line breaks between paragraphs.
+_DOUBLE_NEWLINE_RE = re.compile(r"\n\n")
+
+# Deletes ASCII punctuation with str.translate.
+_PUNCTUATION_TABLE = str.maketrans("", "", string.punctuation)
+
+# Characters a JSON document can start with ("NaN" and "Infinity" are
+# accepted by the json module).
+_JSON_FIRST_CHARS = frozenset('{["-0123456789tfnNI')
+
+# Characters with a special meaning in a regex pattern.
+_REGEX_METACHARS_RE = re.compile(r"[.^$*+?()\[\]{}|\\]")
+
 
 def _normalize_relation(relation):
   """Normalises Slovak relation synonyms to a canonical form."""
   if relation == "minimálne":
-    return "aspoň"
+    return _COMPARISON_RELATION[0]
   return relation
 
 
+def _resolve_relation(relation):
+  """Returns the canonical comparison relation, picking one if it is None.
+
+  Args:
+    relation: A string in _COMPARISON_RELATION, one of its synonyms, or None.
+
+  Returns:
+    A string in _COMPARISON_RELATION.
+
+  Raises:
+    ValueError: If the relation is not supported.
+  """
+  relation = _normalize_relation(relation)
+  if relation is None:
+    return random.choice(_COMPARISON_RELATION)
+  if relation not in _COMPARISON_RELATION:
+    raise ValueError("The supported relation for comparison must be in "
+                     f"{_COMPARISON_RELATION}, but {relation} is given.")
+  return sys.intern(relation)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_language_detector_factory():
+  """Loads the langdetect profiles once, on the first language check."""
+  import langdetect  # pylint: disable=g-import-not-at-top
+  factory = langdetect.DetectorFactory()
+  factory.load_profile(langdetect.PROFILES_DIRECTORY)
+  factory.seed = 0
+  return factory
+
+
+@functools.lru_cache(maxsize=4096)
+def _detect_language(value):
+  """Returns the ISO 639-1 code of the language of `value`.
+
+  Returns None (and logs an error) when langdetect cannot tell the language.
+  Results are cached, as the strict and loose evaluations check the same
+  response with several language instructions.
+  """
+  import langdetect  # pylint: disable=g-import-not-at-top
+  detector = _get_language_detector_factory().create()
+  detector.append(value)
+  try:
+    return detector.detect()
+  except langdetect.LangDetectException as e:
+    logging.error(
+        "Unable to detect language for text %s due to %s", value, e)
+    return None
+
+
+def _strip_list_prefixes(text):
+  """Removes numbered ("1. ") and bulleted ("- ", "* ") list prefixes.
+
+  Equivalent to re.sub(r"(^\s*\d+\.\s*)|(^\s*[-*]\s*)", "", text,
+  flags=re.MULTILINE), including the whitespace (and line breaks) around a
+  prefix, but only visits line starts instead of every position.
+  """
+  parts = []
+  last = 0
+  size = len(text)
+  start = 0
+  while start < size:
+    marker = start
+    while marker < size and text[marker].isspace():
+      marker += 1
+    digits_end = marker
+    while digits_end < size and text[digits_end].isdecimal():
+      digits_end += 1
+    if marker < digits_end < size and text[digits_end] == ".":
+      end = digits_end + 1
+    elif marker < size and text[marker] in "-*":
+      end = marker + 1
+    else:
+      end = -1
+    if end >= 0:
+      while end < size and text[end].isspace():
+        end += 1
+      parts.append(text[last:start])
+      last = end
+      start = end
+      if text[end - 1] == "\n":
+        continue
+    newline = text.find("\n", start)
+    if newline == -1:
+      break
+    start = newline + 1
+  if not parts:
+    return text
+  parts.append(text[last:])
+  return "".join(parts)
+
+
+@functools.lru_cache(maxsize=64)
+def _lowercase(value):
+  """Returns `value.lower()`, cached across the instructions of a response."""
+  return value.lower()
+
+
+def _non_space_bounds(value):
+  """Returns the indices of the first and last non-whitespace characters.
+
+  Unlike `value.strip()`, this does not copy the string. For a blank string
+  the first index is past the last one.
+  """
+  start, end = 0, len(value) - 1
+  while start <= end and value[start].isspace():
+    start += 1
+  while end > start and value[end].isspace():
+    end -= 1
+  return start, end
+
+
+def _count_matches(pattern, values):
+  """Returns a NumPy array with the number of `pattern` matches per value."""
+  return np.fromiter((len(pattern.findall(value)) for value in values),
+                     dtype=np.int64, count=len(values))
+
+
 class Instruction:
   """An instruction template."""
 
@@ -116,6 +280,18 @@ class Instruction:
   def check_following(self, value):
     raise NotImplementedError("`check_following` not implemented.")
 
+  def check_following_batch(self, values):
+    """Checks many responses against this instruction.
+
+    Args:
+      values: A sequence of response strings.
+
+    Returns:
+      A NumPy bool array with the check_following result of each response.
+    """
+    return np.fromiter((self.check_following(value) for value in values),
+                       dtype=bool, count=len(values))
+
 
 class ResponseLanguageChecker(Instruction):
   """Check the language of the entire response."""
@@ -132,7 +308,7 @@ class ResponseLanguageChecker(Instruction):
     """
     self._language = language
     if self._language is None:
-      self._language = random.choice(list(_LANGUAGES.keys()))
+      self._language = random.choice(_LANGUAGE_KEYS)
     self._description_pattern = (
         "Celá tvoja odpoveď musí byť v jazyku {language}, "
         "žiadny iný jazyk nie je povolený.")
@@ -146,12 +322,8 @@ class ResponseLanguageChecker(Instruction):
 
   def check_following(self, value):
     assert isinstance(value, str)
-    try:
-      return langdetect.detect(value) == self._language
-    except langdetect.LangDetectException as e:
-      logging.error(
-          "Unable to detect language for text %s due to %s", value, e)
-      return True
+    language = _detect_language(value)
+    return language is None or language == self._language
 
 
 class NumberOfSentences(Instruction):
@@ -173,14 +345,8 @@ class NumberOfSentences(Instruction):
         self._num_sentences_threshold < 0):
       self._num_sentences_threshold = random.randint(1, _MAX_NUM_SENTENCES)
 
-    relation = _normalize_relation(relation)
-    if relation is None:
-      self._comparison_relation = random.choice(_COMPARISON_RELATION)
-    elif relation not in _COMPARISON_RELATION:
-      raise ValueError("The supported relation for comparison must be in "
-                       f"{_COMPARISON_RELATION}, but {relation} is given.")
-    else:
-      self._comparison_relation = relation
+    self._comparison_relation = _resolve_relation(relation)
+    self._compare = _RELATION_OPERATORS[self._comparison_relation]
 
     self._description_pattern = (
         "Tvoja odpoveď musí obsahovať {relation} {num_sentences} viet.")
@@ -196,14 +362,15 @@ class NumberOfSentences(Instruction):
     return ["num_sentences", "relation"]
 
   def check_following(self, value):
-    cleaned_text = re.sub(r'(^\s*[\d]+\.\s*)|(^\s*[-*]\s*)', '', value,
-                          flags=re.MULTILINE)
+    cleaned_text = _strip_list_prefixes(value)
     num_sentences = sk_instructions_util.count_sentences(cleaned_text)
 
-    if self._comparison_relation == _COMPARISON_RELATION[0]:
-      return num_sentences >= self._num_sentences_threshold
-    elif self._comparison_relation == _COMPARISON_RELATION[1]:
-      return num_sentences <= self._num_sentences_threshold
+    return self._compare(num_sentences, self._num_sentences_threshold)
+
+  def check_following_batch(self, values):
+    num_sentences = np.array(sk_instructions_util.count_sentences_many(
+        _strip_list_prefixes(value) for value in values), dtype=np.int64)
+    return self._compare(num_sentences, self._num_sentences_threshold)
 
 
 class PlaceholderChecker(Instruction):
@@ -236,10 +403,15 @@ class PlaceholderChecker(Instruction):
     return ["num_placeholders"]
 
   def check_following(self, value):
-    placeholders = re.findall(r"\[.*?\]", value)
+    if "[" not in value:
+      return self._num_placeholders <= 0
+    placeholders = _PLACEHOLDER_RE.findall(value)
     num_placeholders = len(placeholders)
     return num_placeholders >= self._num_placeholders
 
+  def check_following_batch(self, values):
+    return _count_matches(_PLACEHOLDER_RE, values) >= self._num_placeholders
+
 
 class BulletListChecker(Instruction):
   """Checks the bullet list in the prompt."""
@@ -270,10 +442,15 @@ class BulletListChecker(Instruction):
     return ["num_bullets"]
 
   def check_following(self, value):
-    bullet_lists = re.findall(r"^\s*\*[^\*].*$", value, flags=re.MULTILINE)
+    if "*" not in value:
+      return self._num_bullets == 0
+    bullet_lists = _BULLET_RE.findall(value)
     num_bullet_lists = len(bullet_lists)
     return num_bullet_lists == self._num_bullets
 
+  def check_following_batch(self, values):
+    return _count_matches(_BULLET_RE, values) == self._num_bullets
+
 
 class ConstrainedResponseChecker(Instruction):
   """Checks the constrained response."""
@@ -293,11 +470,8 @@ class ConstrainedResponseChecker(Instruction):
     return []
 
   def check_following(self, value):
-    value = value.strip()
-    for constrained_response in self._constrained_responses:
-      if constrained_response in value:
-        return True
-    return False
+    return any(constrained_response in value
+               for constrained_response in self._constrained_responses)
 
 
 class HighlightSectionChecker(Instruction):
@@ -318,14 +492,7 @@ class HighlightSectionChecker(Instruction):
     if self._num_highlights is None or self._num_highlights < 0:
       self._num_highlights = random.randint(1, _NUM_HIGHLIGHTED_SECTIONS)
 
-    relation = _normalize_relation(relation)
-    if relation is None:
-      self._comparison_relation = random.choice(_COMPARISON_RELATION)
-    elif relation not in _COMPARISON_RELATION:
-      raise ValueError("The supported relation for comparison must be in "
-                       f"{_COMPARISON_RELATION}, but {relation} is given.")
-    else:
-      self._comparison_relation = relation
+    self._comparison_relation = _resolve_relation(relation)
 
     self._description_pattern = (
         "Zvýrazni {relation} {num_highlights} sekcií vo svojej odpovedi "
@@ -343,17 +510,24 @@ class HighlightSectionChecker(Instruction):
     return ["num_highlights", "relation"]
 
   def check_following(self, value):
+    if "*" not in value:
+      return self._num_highlights <= 0
+    if self._num_highlights <= 0:
+      return True
     num_highlights = 0
-    highlights = re.findall(r"\*[^\n\*]*\*", value)
-    double_highlights = re.findall(r"\*\*[^\n\*]*\*\*", value)
-    for highlight in highlights:
-      if highlight.strip("*").strip():
+    for highlight in _HIGHLIGHT_RE.finditer(value):
+      if highlight.group().strip("*").strip():
         num_highlights += 1
-    for highlight in double_highlights:
-      if highlight.removeprefix("**").removesuffix("**").strip():
+        if num_highlights >= self._num_highlights:
+          return True
+    if "**" not in value:
+      return False
+    for highlight in _DOUBLE_HIGHLIGHT_RE.finditer(value):
+      if highlight.group().removeprefix("**").removesuffix("**").strip():
         num_highlights += 1
-
-    return num_highlights >= self._num_highlights
+        if num_highlights >= self._num_highlights:
+          return True
+    return False
 
 
 class SectionChecker(Instruction):
@@ -376,18 +550,14 @@ class SectionChecker(Instruction):
     if self._section_spliter is None:
       self._section_spliter = random.choice(_SECTION_SPLITER)
 
+    self._section_splitter_re = re.compile(
+        r"\s?" + re.escape(self._section_spliter) + r"\s?\d+\s?")
+
     self._num_sections = num_sections
     if self._num_sections is None or self._num_sections < 0:
       self._num_sections = random.randint(1, _NUM_SECTIONS)
 
-    relation = _normalize_relation(relation)
-    if relation is None:
-      self._comparison_relation = random.choice(_COMPARISON_RELATION)
-    elif relation not in _COMPARISON_RELATION:
-      raise ValueError("The supported relation for comparison must be in "
-                       f"{_COMPARISON_RELATION}, but {relation} is given.")
-    else:
-      self._comparison_relation = relation
+    self._comparison_relation = _resolve_relation(relation)
 
     self._description_pattern = (
         "Tvoja odpoveď musí mať {relation} {num_sections} sekcií. "
@@ -411,9 +581,15 @@ class SectionChecker(Instruction):
     return ["section_spliter", "num_sections", "relation"]
 
   def check_following(self, value):
-    section_splitter_patten = r"\s?" + self._section_spliter + r"\s?\d+\s?"
-    sections = re.split(section_splitter_patten, value)
-    num_sections = len(sections) - 1
+    if self._section_spliter not in value:
+      return self._num_sections <= 0
+    # Each splitter match opens a section; stop counting at the threshold
+    # instead of splitting the whole response.
+    num_sections = 0
+    for _ in self._section_splitter_re.finditer(value):
+      num_sections += 1
+      if num_sections >= self._num_sections:
+        return True
     return num_sections >= self._num_sections
 
 
@@ -447,7 +623,9 @@ class ParagraphChecker(Instruction):
     return ["num_paragraphs"]
 
   def check_following(self, value):
-    paragraphs = re.split(r"\s?\*\*\*\s?", value)
+    # Only whether a paragraph is blank matters, so the whitespace that the
+    # divider may carry on either side needs no separate handling.
+    paragraphs = value.split("***")
     num_paragraphs = len(paragraphs)
 
     for index, paragraph in enumerate(paragraphs):
@@ -478,6 +656,16 @@ class PostscriptChecker(Instruction):
     if self._postscript_marker is None:
       self._postscript_marker = random.choice(_POSTSCRIPT_MARKER)
 
+    if self._postscript_marker == "P.S.":
+      postscript_pattern = r"\s*p\.\s?s\..*$"
+    elif self._postscript_marker == "P.P.S":
+      postscript_pattern = r"\s*p\.\s?p\.\s?s[.]?.*$"
+    else:
+      postscript_pattern = (
+          r"\s*" + re.escape(self._postscript_marker.lower()) + r".*$")
+    self._postscript_re = re.compile(
+        postscript_pattern, re.MULTILINE | re.IGNORECASE)
+
     self._description_pattern = (
         "Na konci odpovede, prosím, explicitne pridaj postskriptum "
         "začínajúce slovom {postscript}")
@@ -491,15 +679,11 @@ class PostscriptChecker(Instruction):
     return ["postscript_marker"]
 
   def check_following(self, value):
-    value = value.lower()
-    if self._postscript_marker == "P.S.":
-      postscript_pattern = r"\s*p\.\s?s\..*$"
-    elif self._postscript_marker == "P.P.S":
-      postscript_pattern = r"\s*p\.\s?p\.\s?s[.]?.*$"
-    else:
-      postscript_pattern = r"\s*" + self._postscript_marker.lower() + r".*$"
-    postscript = re.findall(postscript_pattern, value, flags=re.MULTILINE)
-    return True if postscript else False
+    # Both built-in markers start with "P.".
+    if (self._postscript_marker in _POSTSCRIPT_MARKER
+        and "p." not in value and "P." not in value):
+      return False
+    return self._postscript_re.search(value) is not None
 
 
 class KeywordChecker(Instruction):
@@ -518,9 +702,11 @@ class KeywordChecker(Instruction):
     if not keywords:
       self._keywords = sk_instructions_util.generate_keywords(
           num_keywords=_NUM_KEYWORDS)
+      self._keywords.sort()
     else:
-      self._keywords = keywords
-    self._keywords = sorted(self._keywords)
+      self._keywords = sorted(keywords)
+    self._keyword_res = [re.compile(keyword, re.IGNORECASE)
+                         for keyword in self._keywords]
 
     self._description_pattern = (
         "Zahrň kľúčové slová {keywords} do svojej odpovede.")
@@ -534,10 +720,7 @@ class KeywordChecker(Instruction):
     return ["keywords"]
 
   def check_following(self, value):
-    for keyword in self._keywords:
-      if not re.search(keyword, value, flags=re.IGNORECASE):
-        return False
-    return True
+    return all(keyword_re.search(value) for keyword_re in self._keyword_res)
 
 
 class KeywordFrequencyChecker(Instruction):
@@ -559,19 +742,19 @@ class KeywordFrequencyChecker(Instruction):
           num_keywords=1)[0]
     else:
       self._keyword = keyword.strip()
+    # Keywords are matched as regexes; plain words are counted with str.count.
+    if _REGEX_METACHARS_RE.search(self._keyword):
+      self._keyword_re = re.compile(self._keyword, re.IGNORECASE)
+    else:
+      self._keyword_re = None
+      self._lower_keyword = self._keyword.lower()
 
     self._frequency = frequency
     if self._frequency is None or self._frequency < 0:
       self._frequency = random.randint(1, _KEYWORD_FREQUENCY)
 
-    relation = _normalize_relation(relation)
-    if relation is None:
-      self._comparison_relation = random.choice(_COMPARISON_RELATION)
-    elif relation not in _COMPARISON_RELATION:
-      raise ValueError("The supported relation for comparison must be in "
-                       f"{_COMPARISON_RELATION}, but {relation} is given.")
-    else:
-      self._comparison_relation = relation
+    self._comparison_relation = _resolve_relation(relation)
+    self._compare = _RELATION_OPERATORS[self._comparison_relation]
 
     self._description_pattern = (
         "V odpovedi sa musí slovo {keyword} objaviť {relation} "
@@ -590,14 +773,20 @@ class KeywordFrequencyChecker(Instruction):
   def get_instruction_args_keys(self):
     return ["keyword", "frequency", "relation"]
 
+  def _count_occurrences(self, value):
+    if self._keyword_re is None:
+      return _lowercase(value).count(self._lower_keyword)
+    return len(self._keyword_re.findall(value))
+
   def check_following(self, value):
-    actual_occurrences = len(re.findall(
-        self._keyword, value, flags=re.IGNORECASE))
+    actual_occurrences = self._count_occurrences(value)
+    return self._compare(actual_occurrences, self._frequency)
 
-    if self._comparison_relation == _COMPARISON_RELATION[0]:
-      return actual_occurrences >= self._frequency
-    elif self._comparison_relation == _COMPARISON_RELATION[1]:
-      return actual_occurrences <= self._frequency
+  def check_following_batch(self, values):
+    actual_occurrences = np.fromiter(
+        (self._count_occurrences(value) for value in values),
+        dtype=np.int64, count=len(values))
+    return self._compare(actual_occurrences, self._frequency)
 
 
 class NumberOfWords(Instruction):
@@ -618,14 +807,8 @@ class NumberOfWords(Instruction):
       self._num_words = random.randint(
           _NUM_WORDS_LOWER_LIMIT, _NUM_WORDS_UPPER_LIMIT)
 
-    relation = _normalize_relation(relation)
-    if relation is None:
-      self._comparison_relation = random.choice(_COMPARISON_RELATION)
-    elif relation not in _COMPARISON_RELATION:
-      raise ValueError("The supported relation for comparison must be in "
-                       f"{_COMPARISON_RELATION}, but {relation} is given.")
-    else:
-      self._comparison_relation = relation
+    self._comparison_relation = _resolve_relation(relation)
+    self._compare = _RELATION_OPERATORS[self._comparison_relation]
 
     self._description_pattern = (
         "Odpovedz {relation} {num_words} slovami.")
@@ -642,15 +825,17 @@ class NumberOfWords(Instruction):
     return ["num_words", "relation"]
 
   def check_following(self, value):
-    cleaned_text = re.sub(r'(^\s*[\d]+\.\s*)|(^\s*[-*]\s*)', '', value,
-                          flags=re.MULTILINE)
+    cleaned_text = _strip_list_prefixes(value)
     cleaned_text_without_newlines = cleaned_text.replace('\n', ' ')
     num_words = sk_instructions_util.count_words(cleaned_text_without_newlines)
 
-    if self._comparison_relation == _COMPARISON_RELATION[0]:
-      return num_words >= self._num_words
-    elif self._comparison_relation == _COMPARISON_RELATION[1]:
-      return num_words <= self._num_words
+    return self._compare(num_words, self._num_words)
+
+  def check_following_batch(self, values):
+    num_words = np.array(sk_instructions_util.count_words_many(
+        _strip_list_prefixes(value).replace("\n", " ") for value in values),
+                         dtype=np.int64)
+    return self._compare(num_words, self._num_words)
 
 
 class JsonFormat(Instruction):
@@ -678,6 +863,14 @@ class JsonFormat(Instruction):
         .removesuffix("```")
         .strip()
     )
+    if not value or value[0] not in _JSON_FIRST_CHARS:
+      return False
+    if orjson is not None:
+      try:
+        orjson.loads(value)
+        return True
+      except orjson.JSONDecodeError:
+        pass  # json accepts a few documents orjson rejects, e.g. NaN.
     try:
       json.loads(value)
     except ValueError:
@@ -738,7 +931,7 @@ class ParagraphFirstWordCheck(Instruction):
     return ["num_paragraphs", "nth_paragraph", "first_word"]
 
   def check_following(self, value):
-    paragraphs = re.split(r"\n\n", value)
+    paragraphs = _DOUBLE_NEWLINE_RE.split(value)
     num_paragraphs = len(paragraphs)
 
     for paragraph in paragraphs:
@@ -752,19 +945,19 @@ class ParagraphFirstWordCheck(Instruction):
     else:
       return False
 
-    def remove_punctuation(word):
-      return ''.join(char for char in word if char not in string.punctuation)
-
     expected_words = self._first_word.split()
     num_expected_words = len(expected_words)
 
-    paragraph_words = [remove_punctuation(word).lower()
-                       for word in paragraph.split()]
+    head_words = paragraph.split(maxsplit=num_expected_words)[
+        :num_expected_words]
 
-    if len(paragraph_words) < num_expected_words:
+    if len(head_words) < num_expected_words:
       return False
 
-    extracted_words = paragraph_words[:num_expected_words]
+    # Words hold no spaces, so one translate/lower over the joined head and a
+    # split on " " cleans each word exactly as a per-word pass would.
+    extracted_words = " ".join(head_words).translate(
+        _PUNCTUATION_TABLE).lower().split(" ") if head_words else []
 
     return (
         num_paragraphs == self._num_paragraphs
@@ -788,9 +981,11 @@ class ForbiddenWords(Instruction):
     if not forbidden_words:
       self._forbidden_words = sk_instructions_util.generate_keywords(
           num_keywords=_NUM_KEYWORDS)
+      self._forbidden_words.sort()
     else:
-      self._forbidden_words = list(set(forbidden_words))
-    self._forbidden_words = sorted(self._forbidden_words)
+      self._forbidden_words = sorted(set(forbidden_words))
+    self._forbidden_re = re.compile(
+        r"\b(?:" + "|".join(self._forbidden_words) + r")\b", re.IGNORECASE)
     self._description_pattern = (
         "Nepoužívaj kľúčové slová {forbidden_words} vo svojej odpovedi."
     )
@@ -805,10 +1000,7 @@ class ForbiddenWords(Instruction):
     return ["forbidden_words"]
 
   def check_following(self, value):
-    for word in self._forbidden_words:
-      if re.search(r"\b" + word + r"\b", value, flags=re.IGNORECASE):
-        return False
-    return True
+    return self._forbidden_re.search(value) is None
 
 
 class TwoResponsesChecker(Instruction):
@@ -829,6 +1021,8 @@ class TwoResponsesChecker(Instruction):
     return []
 
   def check_following(self, value):
+    if "******" not in value:
+      return False
     valid_responses = list()
     responses = value.split("******")
     for index, response in enumerate(responses):
@@ -859,6 +1053,8 @@ class RepeatPromptThenAnswer(Instruction):
       raise ValueError("prompt_to_repeat must be set.")
     else:
       self._prompt_to_repeat = prompt_to_repeat
+    self._prompt_to_repeat_stripped = self._prompt_to_repeat.strip()
+    self._prompt_to_repeat_lower = self._prompt_to_repeat_stripped.lower()
     self._description_pattern = (
         "Najprv zopakuj požiadavku bez zmeny, potom daj svoju odpoveď "
         "(nič nehovor pred zopakovaním požiadavky; požiadavka, ktorú je "
@@ -873,10 +1069,9 @@ class RepeatPromptThenAnswer(Instruction):
     return ["prompt_to_repeat"]
 
   def check_following(self, value):
-    if value.strip().lower().startswith(
-        self._prompt_to_repeat.strip().lower()):
-      return True
-    return False
+    # Only a prompt-sized prefix of the response needs lowercasing.
+    head = value.lstrip()[:len(self._prompt_to_repeat_stripped)]
+    return head.lower().startswith(self._prompt_to_repeat_lower)
 
 
 class EndChecker(Instruction):
@@ -895,6 +1090,7 @@ class EndChecker(Instruction):
         end_phrase.strip() if isinstance(end_phrase, str) else end_phrase)
     if self._end_phrase is None:
       self._end_phrase = random.choice(_ENDING_OPTIONS)
+    self._end_phrase_lower = self._end_phrase.strip().lower()
     self._description_pattern = (
         "Ukonči svoju odpoveď touto presnou frázou {ender}. "
         "Za touto frázou nesmú nasledovať žiadne ďalšie slová.")
@@ -907,11 +1103,18 @@ class EndChecker(Instruction):
     return ["end_phrase"]
 
   def check_following(self, value):
-    value = value.strip().strip('"').lower()
-    self._end_phrase = self._end_phrase.strip().lower()
+    value = value.rstrip().rstrip('"')
+    # Only the end of the response can match; a few spare characters keep
+    # the trailing period inside the lowercased tail.
+    tail_size = len(self._end_phrase_lower) + 8
+    if len(value) > tail_size:
+      value = value[-tail_size:]
+    else:
+      value = value.lstrip().lstrip('"')
+    value = value.lower()
     if value and value[-1] == ".":
       value = value[:-1]
-    return value.endswith(self._end_phrase)
+    return value.endswith(self._end_phrase_lower)
 
 
 class TitleChecker(Instruction):
@@ -932,9 +1135,7 @@ class TitleChecker(Instruction):
     return []
 
   def check_following(self, value):
-    pattern = r"<<[^\n]+>>"
-    re_pattern = re.compile(pattern)
-    titles = re.findall(re_pattern, value)
+    titles = _TITLE_RE.findall(value)
 
     for title in titles:
       if title.lstrip("<").rstrip(">").strip():
@@ -964,24 +1165,21 @@ class LetterFrequencyChecker(Instruction):
         or ord(letter.lower()) < 97
         or ord(letter.lower()) > 122
     ):
-      self._letter = random.choice(list(string.ascii_letters))
+      self._letter = random.choice(string.ascii_letters)
     else:
       self._letter = letter.strip()
     self._letter = self._letter.lower()
+    # All characters that lowercase to the letter, so that the response can
+    # be counted without lowercasing it.
+    self._letter_forms = ((self._letter, self._letter.upper()) +
+                          _NON_ASCII_UPPERCASE.get(self._letter, ()))
 
     self._frequency = let_frequency
     if self._frequency is None or self._frequency < 0:
       self._frequency = random.randint(1, _LETTER_FREQUENCY)
 
-    let_relation = _normalize_relation(let_relation)
-    if let_relation is None:
-      self._comparison_relation = random.choice(_COMPARISON_RELATION)
-    elif let_relation not in _COMPARISON_RELATION:
-      raise ValueError(
-          "The supported relation for comparison must be in "
-          f"{_COMPARISON_RELATION}, but {let_relation} is given.")
-    else:
-      self._comparison_relation = let_relation
+    self._comparison_relation = _resolve_relation(let_relation)
+    self._compare = _RELATION_OPERATORS[self._comparison_relation]
 
     self._description_pattern = (
         "Vo svojej odpovedi by sa písmeno {letter} malo objaviť "
@@ -1001,13 +1199,8 @@ class LetterFrequencyChecker(Instruction):
     return ["letter", "let_frequency", "let_relation"]
 
   def check_following(self, value):
-    value = value.lower()
-    letters = collections.Counter(value)
-
-    if self._comparison_relation == _COMPARISON_RELATION[0]:
-      return letters[self._letter] >= self._frequency
-    else:
-      return letters[self._letter] <= self._frequency
+    num_letters = sum(value.count(form) for form in self._letter_forms)
+    return self._compare(num_letters, self._frequency)
 
 
 class CapitalLettersSlovakChecker(Instruction):
@@ -1028,12 +1221,10 @@ class CapitalLettersSlovakChecker(Instruction):
 
   def check_following(self, value):
     assert isinstance(value, str)
-    try:
-      return value.isupper() and langdetect.detect(value) == "sk"
-    except langdetect.LangDetectException as e:
-      logging.error(
-          "Unable to detect language for text %s due to %s", value, e)
-      return True
+    if not value.isupper():
+      return False
+    language = _detect_language(value)
+    return language is None or language == "sk"
 
 
 class LowercaseLettersSlovakChecker(Instruction):
@@ -1055,12 +1246,10 @@ class LowercaseLettersSlovakChecker(Instruction):
 
   def check_following(self, value):
     assert isinstance(value, str)
-    try:
-      return value.islower() and langdetect.detect(value) == "sk"
-    except langdetect.LangDetectException as e:
-      logging.error(
-          "Unable to detect language for text %s due to %s", value, e)
-      return True
+    if not value.islower():
+      return False
+    language = _detect_language(value)
+    return language is None or language == "sk"
 
 
 class CommaChecker(Instruction):
@@ -1080,7 +1269,7 @@ class CommaChecker(Instruction):
     return []
 
   def check_following(self, value):
-    return not re.search(r"\,", value)
+    return "," not in value
 
 
 class CapitalWordFrequencyChecker(Instruction):
@@ -1101,14 +1290,8 @@ class CapitalWordFrequencyChecker(Instruction):
     if self._frequency is None:
       self._frequency = random.randint(1, _ALL_CAPITAL_WORD_FREQUENCY)
 
-    capital_relation = _normalize_relation(capital_relation)
-    self._comparison_relation = capital_relation
-    if capital_relation is None:
-      self._comparison_relation = random.choice(_COMPARISON_RELATION)
-    elif capital_relation not in _COMPARISON_RELATION:
-      raise ValueError(
-          "The supported relation for comparison must be in "
-          f"{_COMPARISON_RELATION}, but {capital_relation} is given.")
+    self._comparison_relation = _resolve_relation(capital_relation)
+    self._compare = _RELATION_OPERATORS[self._comparison_relation]
 
     self._description_pattern = (
         "Vo svojej odpovedi by sa slová napísané úplne veľkými písmenami "
@@ -1127,14 +1310,8 @@ class CapitalWordFrequencyChecker(Instruction):
     return ["capital_frequency", "capital_relation"]
 
   def check_following(self, value):
-    words = sk_instructions_util.tokenize_words(value)
-    capital_words = [word for word in words if word.isupper()]
-    capital_words = len(capital_words)
-
-    if self._comparison_relation == _COMPARISON_RELATION[0]:
-      return capital_words >= self._frequency
-    else:
-      return capital_words <= self._frequency
+    capital_words = sk_instructions_util.count_capital_words(value)
+    return self._compare(capital_words, self._frequency)
 
 
 class QuotationChecker(Instruction):
@@ -1154,5 +1331,5 @@ class QuotationChecker(Instruction):
     return []
 
   def check_following(self, value):
-    value = value.strip()
-    return len(value) > 1 and value[0] == '"' and value[-1] == '"'
+    start, end = _non_space_bounds(value)
+    return end > start and value[start] == '"' and value[end] == '"'
@@ -2,7 +2,14 @@
 """Translate all string values in a JSONL file from English into Slovak via OpenAI.
 
 Key names are preserved. Non-string values (numbers, booleans, null) are passed through unchanged.
-Nested dicts and lists are traversed recursively.
+Nested dicts and lists are traversed recursively. With --batch-size N, up to N lines are sent
+to the model together as one JSON array, which cuts the number of API round-trips N-fold.
+Requests are sent concurrently from an asyncio event loop, at most --concurrency at a time; the
+output keeps the input order. Lines without any string containing Latin letters have nothing to
+translate and are copied without an API call. Identical lines are translated once. With
+--cache-file, every translation is also appended to a sidecar cache file that later runs with
+the same model and system prompts reuse. With --strings-only, only the translatable strings are sent as a
+flat JSON array, without keys or structure, and written back into place.
 
 Usage:
     export OPENAI_API_KEY=sk-...
@@ -16,58 +23,311 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import asyncio
+import codecs
+import contextlib
+import hashlib
 import json
+import math
 import os
+import re
 import sys
-import time
-from typing import Any
+from typing import Any, BinaryIO, Iterator
+
+try:
+    from openai import AsyncOpenAI
+except ImportError:  # reported by build_client, so that --help works without it
+    AsyncOpenAI = None
+
+from api_utils import ORJSON_AVAILABLE, bounded, dumps, loads, truncate_partial_line
 
 SYSTEM_PROMPT = (
     "You are a translation engine. Your receive text in JSON format. Your goal is to pick some values and translate them into Slovak. Don't translate value of instruction_id_list."
     "Translate value of prompt key into Slovak langugage. Translate all english words in kwargs key into Slovak. Leave all special characters and unknown strings intact.  Make sure the Slovak text is grammatically correct.  Your output must be valid JSON, nothing else."
 )
 
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT + (
+    " You may receive a JSON array of such objects instead of a single one. Then translate every element of the array the same way"
+    " and return a JSON array with the same number of elements in the same order."
+)
+
+STRINGS_SYSTEM_PROMPT = (
+    "You are a translation engine. You receive a JSON array of strings. Translate every string into Slovak."
+    " Leave all special characters and unknown strings intact. Make sure the Slovak text is grammatically correct."
+    " Your output must be a JSON array of strings with the same number of elements in the same order, nothing else."
+)
+
+# Values under these keys are identifiers and are never translated.
+_UNTRANSLATED_KEYS = frozenset({"instruction_id_list"})
+
+
+# Whitespace allowed between JSON documents.
+_JSON_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+
+# Characters that can continue a number which the decoder has already accepted.
+_NUMBER_CONTINUATION = frozenset(".eE")
+
+# Integers orjson can serialize exactly.
+_INT_MIN, _INT_MAX = -(1 << 63), (1 << 64) - 1
+
+# A string is only worth sending to the model if it contains at least one Latin letter.
+_LATIN_LETTER_RE = re.compile(r"[A-Za-z]")
+
+
+def has_translatable(obj: Any) -> bool:
+    """Return True if any string value nested in `obj` contains a Latin letter.
+
+    Values under `_UNTRANSLATED_KEYS` are not considered.
+    """
+    if isinstance(obj, str):
+        return _LATIN_LETTER_RE.search(obj) is not None
+    if isinstance(obj, dict):
+        return any(has_translatable(value) for key, value in obj.items() if key not in _UNTRANSLATED_KEYS)
+    if isinstance(obj, list):
+        return any(has_translatable(value) for value in obj)
+    return False
+
 
-def translate_object(client, obj: Any, model: str, retries: int = 3) -> Any:
-    """Send a string or JSON object to the API and return the translated result."""
+def extract_strings(obj: Any, path: tuple = ()) -> list[tuple[tuple, str]]:
+    """Return (path, string) pairs for the translatable strings nested in `obj`.
+
+    A path is the sequence of dict keys and list indices leading to the string.
+    """
+    if isinstance(obj, str):
+        return [(path, obj)] if _LATIN_LETTER_RE.search(obj) else []
+    pairs = []
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if key not in _UNTRANSLATED_KEYS:
+                pairs.extend(extract_strings(value, path + (key,)))
+    elif isinstance(obj, list):
+        for index, value in enumerate(obj):
+            pairs.extend(extract_strings(value, path + (index,)))
+    return pairs
+
+
+def replace_strings(obj: Any, replacements: list[tuple[tuple, str]]) -> Any:
+    """Return a copy of `obj` with the string at each path replaced."""
+    if not replacements:
+        return obj
+    obj = loads(dumps(obj))
+    for path, value in replacements:
+        if not path:
+            return value
+        target = obj
+        for step in path[:-1]:
+            target = target[step]
+        target[path[-1]] = value
+    return obj
+
+
+async def translate_object(create, obj: Any, model: str, retries: int = 3,
+                           system_prompt: str = SYSTEM_PROMPT) -> Any:
+    """Send a string or JSON object to the API and return the translated result.
+
+    `create` is the bound `client.chat.completions.create` method.
+    """
     is_str = isinstance(obj, str)
-    text = obj if is_str else json.dumps(obj, ensure_ascii=False)
+    text = obj if is_str else dumps(obj).decode("utf-8")
     for attempt in range(retries):
         try:
-            response = client.chat.completions.create(
+            response = await create(
                 model=model,
                 messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "system", "content": system_prompt},
                     {"role": "user", "content": text},
                 ],
                 temperature=0.0,
             )
             result = response.choices[0].message.content.strip()
-            return result if is_str else json.loads(result)
+            return result if is_str else loads(result)
         except json.JSONDecodeError as exc:
             if attempt == retries - 1:
                 raise ValueError(f"Model returned invalid JSON: {exc}") from exc
             wait = 2 ** attempt
             print(f"[warn] Invalid JSON in response (attempt {attempt + 1}/{retries}): {exc}. Retrying in {wait}s…", file=sys.stderr)
-            time.sleep(wait)
+            await asyncio.sleep(wait)
         except Exception as exc:
             if attempt == retries - 1:
                 raise
             wait = 2 ** attempt
             print(f"[warn] API error (attempt {attempt + 1}/{retries}): {exc}. Retrying in {wait}s…", file=sys.stderr)
-            time.sleep(wait)
+            await asyncio.sleep(wait)
     return obj  # unreachable
 
 
+async def translate_batch(create, objs: list[Any], model: str, retries: int = 3) -> list[Any]:
+    """Translate several objects with a single request and return the results in order.
+
+    The objects are sent as one JSON array. If the model does not answer with an array of
+    the same length, every object of the batch is translated on its own instead. Objects
+    without translatable strings are returned unchanged and never sent.
+    """
+    todo = [index for index, obj in enumerate(objs) if has_translatable(obj)]
+    if len(todo) < len(objs):
+        results = list(objs)
+        if todo:
+            translated = await translate_batch(create, [objs[index] for index in todo], model, retries)
+            for index, result in zip(todo, translated):
+                results[index] = result
+        return results
+    if len(objs) == 1:
+        return [await translate_object(create, objs[0], model, retries)]
+    try:
+        result = await translate_object(create, objs, model, retries, system_prompt=BATCH_SYSTEM_PROMPT)
+    except ValueError as exc:
+        result = exc
+    if isinstance(result, list) and len(result) == len(objs):
+        return result
+    print(f"[warn] Batch of {len(objs)} lines was not translated as a whole ({result!r:.200}). Translating line by line…", file=sys.stderr)
+    return [await translate_object(create, obj, model, retries) for obj in objs]
+
+
+async def translate_strings(create, objs: list[Any], model: str, retries: int = 3) -> list[Any]:
+    """Translate only the strings of several objects and return the results in order.
+
+    All translatable strings are sent as one flat JSON array, so keys and JSON punctuation
+    cost no tokens, and the replies are written back in place. If the model does not answer
+    with an array of as many strings, the objects go through `translate_batch` instead.
+    """
+    extracted = [extract_strings(obj) for obj in objs]
+    strings = [text for pairs in extracted for _, text in pairs]
+    if not strings:
+        return list(objs)
+    try:
+        result = await translate_object(create, strings, model, retries, system_prompt=STRINGS_SYSTEM_PROMPT)
+    except ValueError as exc:
+        result = exc
+    if not (isinstance(result, list) and len(result) == len(strings) and all(isinstance(text, str) for text in result)):
+        print(f"[warn] {len(strings)} strings were not translated as a list ({result!r:.200}). Translating whole lines…", file=sys.stderr)
+        return await translate_batch(create, objs, model, retries)
+    translated = iter(result)
+    return [replace_strings(obj, [(path, next(translated)) for path, _ in pairs])
+            for obj, pairs in zip(objs, extracted)]
+
+
+# Input is parsed with the stdlib decoder but written with orjson when it is installed.
+# orjson turns NaN and Infinity into null and refuses integers beyond 64 bits, so in that
+# case such values are rejected on input instead of being changed silently. The stdlib
+# fallback round-trips them and accepts them.
+def _reject_constant(name: str) -> Any:
+    raise ValueError(f"{name} is not supported")
+
+
+def _parse_float(text: str) -> float:
+    value = float(text)
+    if not math.isfinite(value):
+        raise ValueError(f"{text} does not fit in a double")
+    return value
+
+
+def _parse_int(text: str) -> int:
+    value = int(text)
+    if not _INT_MIN <= value <= _INT_MAX:
+        raise ValueError(f"{text} does not fit in 64 bits")
+    return value
+
+
+def iter_json_objects(fp: BinaryIO, bufsize: int = 1 << 20) -> Iterator[tuple[int, Any]]:
+    """Yield (lineno, object) for every line of a JSONL file, skipping blank lines.
+
+    The file is read in chunks of at least `bufsize` bytes and parsed with
+    `json.JSONDecoder.raw_decode`, so a long line may span many chunks and one chunk may
+    hold many lines. `lineno` is the line of the document.
+
+    Raises:
+        ValueError: If a line is not exactly one JSON document, or, when orjson is
+            installed, holds NaN, Infinity, a number that overflows a double or an integer
+            beyond 64 bits.
+    """
+    if ORJSON_AVAILABLE:
+        decoder = json.JSONDecoder(parse_float=_parse_float, parse_int=_parse_int,
+                                   parse_constant=_reject_constant)
+    else:
+        decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, lineno, eof = "", 0, 1, False
+    # Set after a document until the end of its line; anything else there is an error.
+    line_done = False
+    while True:
+        start = _JSON_WHITESPACE_RE.match(buf, pos).end()
+        newlines = buf.count("\n", pos, start)
+        lineno += newlines
+        line_done = line_done and not newlines
+        pos = start
+        if pos < len(buf):
+            if line_done:
+                raise ValueError(f"Line {lineno}: invalid JSON – Extra data after the document")
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as exc:
+                # A document never spans lines, so if the line is complete it is invalid.
+                if eof or buf.find("\n", pos) != -1:
+                    raise ValueError(f"Line {lineno}: invalid JSON – {exc.msg}") from exc
+            except ValueError as exc:
+                raise ValueError(f"Line {lineno}: invalid JSON – {exc}") from exc
+            else:
+                if buf.count("\n", pos, end):
+                    raise ValueError(f"Line {lineno}: invalid JSON – Document spans several lines")
+                # A document running up to the end of the buffer, or a number cut off before
+                # its fraction or exponent, may continue in the next chunk.
+                cut = end == len(buf) or (
+                    isinstance(obj, (int, float)) and buf[end] in _NUMBER_CONTINUATION)
+                if eof or not cut:
+                    yield lineno, obj
+                    pos = end
+                    line_done = True
+                    continue
+        elif eof:
+            return
+        # Read at least as much as is still buffered, so a line spanning many chunks is
+        # re-parsed only a logarithmic number of times.
+        chunk = fp.read(max(bufsize, len(buf) - pos))
+        eof = not chunk
+        buf = buf[pos:] + utf8.decode(chunk, final=eof)
+        pos = 0
+
+
+def translation_key(model: str, system_prompts: tuple[str, ...], obj: Any) -> str:
+    """Return a content hash identifying the translation of `obj` by `model`.
+
+    `system_prompts` are the prompts the translation may be made with, so that editing
+    any of them invalidates earlier cached translations.
+    """
+    entry = {"m": model, "p": system_prompts, "o": obj}
+    canonical = json.dumps(entry, ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load_translation_cache(path: str) -> dict[str, Any]:
+    """Read the translations stored by earlier runs in a JSONL sidecar file.
+
+    A trailing line left incomplete by an interrupted run is cut off so new
+    entries can be appended.
+    """
+    cache: dict[str, Any] = {}
+    if not os.path.exists(path):
+        return cache
+    for line in truncate_partial_line(path).splitlines():
+        try:
+            entry = loads(line)
+            cache[entry["key"]] = entry["translation"]
+        except (ValueError, KeyError, TypeError):
+            continue
+    return cache
+
+
 def build_client(api_key: str, base_url: str | None):
-    from openai import OpenAI  # imported here so error message is clear
+    if AsyncOpenAI is None:
+        print("Error: the openai package is required (pip install openai).", file=sys.stderr)
+        sys.exit(1)
     kwargs: dict[str, Any] = {"api_key": api_key}
     if base_url:
         kwargs["base_url"] = base_url
-    return OpenAI(**kwargs)
+    return AsyncOpenAI(**kwargs)
 
 
-def main() -> None:
+async def main() -> None:
     parser = argparse.ArgumentParser(description="Translate JSONL string values EN→SK via OpenAI.")
     parser.add_argument("-i", "--input", required=True, help="Input JSONL file path")
     parser.add_argument("-o", "--output", required=True, help="Output JSONL file path")
@@ -83,6 +343,24 @@ def main() -> None:
     )
     parser.add_argument("--model", default="gpt-4o-mini", help="Model name (default: gpt-4o-mini)")
     parser.add_argument("--retries", type=int, default=3, help="Retry count on transient errors (default: 3)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Number of lines translated per API request (default: 1)")
+    parser.add_argument(
+        "--concurrency",
+        "--workers",
+        type=int,
+        default=8,
+        help="Maximum number of requests in flight (default: 8)",
+    )
+    parser.add_argument(
+        "--cache-file",
+        default=None,
+        help="JSONL file caching translations across runs (default: no cache)",
+    )
+    parser.add_argument(
+        "--strings-only",
+        action="store_true",
+        help="Send only the translatable strings as a flat JSON array instead of whole JSON lines (fewer tokens).",
+    )
     args = parser.parse_args()
 
     api_key = args.api_key or os.environ.get("OPENAI_API_KEY")
@@ -90,25 +368,67 @@ def main() -> None:
         print("Error: provide --api-key or set the OPENAI_API_KEY environment variable.", file=sys.stderr)
         sys.exit(1)
 
-    client = build_client(api_key, args.base_url)
+    # Parse the whole input first so a malformed line aborts before any request is sent.
+    with open(args.input, "rb") as fin:
+        try:
+            records = list(iter_json_objects(fin))
+        except ValueError as exc:
+            print(f"[error] {exc}", file=sys.stderr)
+            sys.exit(1)
 
-    with open(args.input, encoding="utf-8") as fin, open(args.output, "w", encoding="utf-8") as fout:
-        for lineno, line in enumerate(fin, start=1):
-            line = line.rstrip("\n")
-            if not line:
-                continue
-            try:
-                obj = json.loads(line)
-            except json.JSONDecodeError as exc:
-                print(f"[error] Line {lineno}: invalid JSON – {exc}", file=sys.stderr)
-                sys.exit(1)
+    cache_file = args.cache_file
+    cache = load_translation_cache(cache_file) if cache_file else {}
+    if cache:
+        print(f"[info] Loaded {len(cache)} cached translations from {cache_file}", file=sys.stderr)
+
+    # Each distinct object is sent once; cached and untranslatable ones are not sent at all.
+    system_prompts = (SYSTEM_PROMPT, BATCH_SYSTEM_PROMPT)
+    if args.strings_only:
+        system_prompts = (STRINGS_SYSTEM_PROMPT,) + system_prompts
+    keys = [translation_key(args.model, system_prompts, obj) for _, obj in records]
+    pending: dict[str, Any] = {}
+    for key, (_, obj) in zip(keys, records):
+        if key not in cache and key not in pending and has_translatable(obj):
+            pending[key] = obj
+    todo = list(pending.items())
+    batch_size = max(1, args.batch_size)
+    batches = [todo[start:start + batch_size] for start in range(0, len(todo), batch_size)]
 
-            translated = translate_object(client, obj, args.model, args.retries)
-            fout.write(json.dumps(translated, ensure_ascii=False) + "\n")
-            print(f"[info] Translated line {lineno}", file=sys.stderr)
+    client = build_client(api_key, args.base_url)
+    create = client.chat.completions.create
+    translate = translate_strings if args.strings_only else translate_batch
+    sem = asyncio.Semaphore(max(1, args.concurrency))
+    # All batches are scheduled up front; the semaphore caps how many are in flight while
+    # results are consumed below in input order.
+    tasks = [
+        asyncio.ensure_future(bounded(sem, translate(create, [obj for _, obj in batch], args.model, args.retries)))
+        for batch in batches
+    ]
+    try:
+        with open(args.output, "wb", buffering=1 << 20) as fout, \
+                (open(cache_file, "ab") if cache_file else contextlib.nullcontext()) as fcache:
+            done = zip(batches, tasks)
+            for key, (lineno, obj) in zip(keys, records):
+                # Batches follow the order in which objects first appear, so the one holding
+                # this line is always among the next to finish.
+                while key in pending and key not in cache:
+                    batch, task = next(done)
+                    translated = await task
+                    for (batch_key, _), result in zip(batch, translated):
+                        cache[batch_key] = result
+                        if fcache is not None:
+                            fcache.write(dumps({"key": batch_key, "translation": result}) + b"\n")
+                    if fcache is not None:
+                        fcache.flush()
+                fout.write(dumps(cache.get(key, obj)) + b"\n")
+                print(f"[info] Translated line {lineno}", file=sys.stderr)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await client.close()
 
     print(f"Done. Output written to {args.output}", file=sys.stderr)
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())